@@ -1,14 +1,35 @@
+import queue
 import sqlite3
-from contextlib import closing
+from contextlib import closing, contextmanager
+from io import BytesIO
 import pandas as pd
 import streamlit as st
 from datetime import datetime
 
 DB_PATH = "inventory.db"
+# connections shared by all sessions; with WAL, readers on separate connections run in parallel
+POOL_SIZE = 5
+
+# journal_mode is persisted in the db file; the rest are per-connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA cache_size=-20000;",
+    "PRAGMA foreign_keys=ON;",
+)
 
 # ------------------------ DB SETUP ------------------------
+def apply_pragmas(conn):
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+# schema setup and migrations run once per server process, not on every rerun
+@st.cache_resource(show_spinner=False)
 def init_db():
     with closing(sqlite3.connect(DB_PATH)) as conn:
+        apply_pragmas(conn)
         c = conn.cursor()
         c.execute("""
         CREATE TABLE IF NOT EXISTS SpareParts (
@@ -19,13 +40,15 @@ def init_db():
             supplier TEXT,
             min_qty INTEGER DEFAULT 0,
             current_qty INTEGER DEFAULT 0,
-            location TEXT
+            location TEXT,
+            low_stock INTEGER GENERATED ALWAYS AS (current_qty < min_qty) VIRTUAL
         );
         """)
         c.execute("""
         CREATE TABLE IF NOT EXISTS Transactions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             part_id INTEGER NOT NULL,
+            part_number TEXT,
             ts TEXT NOT NULL,
             user TEXT,
             action TEXT CHECK(action IN ('IN','OUT')) NOT NULL,
@@ -34,10 +57,95 @@ def init_db():
             FOREIGN KEY (part_id) REFERENCES SpareParts(id) ON DELETE CASCADE
         );
         """)
+        # part_number is denormalized onto Transactions so the log reads without a JOIN
+        tx_columns = [r[1] for r in c.execute("PRAGMA table_info(Transactions);")]
+        if "part_number" not in tx_columns:
+            c.execute("ALTER TABLE Transactions ADD COLUMN part_number TEXT;")
+            # rows left behind by deletes made before foreign_keys=ON were hidden by the old JOIN
+            c.execute("DELETE FROM Transactions WHERE part_id NOT IN (SELECT id FROM SpareParts);")
+            c.execute("""
+            UPDATE Transactions
+            SET part_number = (SELECT s.part_number FROM SpareParts s WHERE s.id = Transactions.part_id);
+            """)
+        # the edit form always writes part_number, so only an actual rename touches the log
+        c.execute("DROP TRIGGER IF EXISTS SpareParts_tx_partno;")
+        c.execute("""
+        CREATE TRIGGER SpareParts_tx_partno AFTER UPDATE OF part_number ON SpareParts
+        WHEN old.part_number IS NOT new.part_number BEGIN
+            UPDATE Transactions SET part_number = new.part_number WHERE part_id = new.id;
+        END;
+        """)
+        # serves the rename trigger and the ON DELETE CASCADE from SpareParts
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tx_part ON Transactions(part_id);")
+        # ORDER BY part_number is already served by the UNIQUE autoindex
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tx_ts ON Transactions(ts DESC, part_id);")
+        # ALTER TABLE cannot add STORED generated columns, so low_stock is VIRTUAL; the partial index makes it cheap
+        parts_columns = [r[1] for r in c.execute("PRAGMA table_xinfo(SpareParts);")]
+        if "low_stock" not in parts_columns:
+            c.execute("""
+            ALTER TABLE SpareParts
+            ADD COLUMN low_stock INTEGER GENERATED ALWAYS AS (current_qty < min_qty) VIRTUAL;
+            """)
+        c.execute("DROP INDEX IF EXISTS idx_parts_low;")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_parts_lowbool ON SpareParts(part_number) WHERE low_stock = 1;")
+        # external-content FTS index over the searchable columns, kept in sync by triggers
+        fts_exists = c.execute("SELECT 1 FROM sqlite_master WHERE name='SparePartsFTS';").fetchone()
+        c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS SparePartsFTS USING fts5(
+            part_number, description, machine_type, supplier,
+            content='SpareParts', content_rowid='id'
+        );
+        """)
+        c.execute("""
+        CREATE TRIGGER IF NOT EXISTS SpareParts_fts_ai AFTER INSERT ON SpareParts BEGIN
+            INSERT INTO SparePartsFTS (rowid, part_number, description, machine_type, supplier)
+            VALUES (new.id, new.part_number, new.description, new.machine_type, new.supplier);
+        END;
+        """)
+        c.execute("""
+        CREATE TRIGGER IF NOT EXISTS SpareParts_fts_ad AFTER DELETE ON SpareParts BEGIN
+            INSERT INTO SparePartsFTS (SparePartsFTS, rowid, part_number, description, machine_type, supplier)
+            VALUES ('delete', old.id, old.part_number, old.description, old.machine_type, old.supplier);
+        END;
+        """)
+        # stock movements only touch current_qty, so they skip the FTS update
+        c.execute("""
+        CREATE TRIGGER IF NOT EXISTS SpareParts_fts_au
+        AFTER UPDATE OF part_number, description, machine_type, supplier ON SpareParts BEGIN
+            INSERT INTO SparePartsFTS (SparePartsFTS, rowid, part_number, description, machine_type, supplier)
+            VALUES ('delete', old.id, old.part_number, old.description, old.machine_type, old.supplier);
+            INSERT INTO SparePartsFTS (rowid, part_number, description, machine_type, supplier)
+            VALUES (new.id, new.part_number, new.description, new.machine_type, new.supplier);
+        END;
+        """)
+        if not fts_exists:
+            c.execute("INSERT INTO SparePartsFTS (SparePartsFTS) VALUES ('rebuild');")
         conn.commit()
 
-def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+def open_conn():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    apply_pragmas(conn)
+    return conn
+
+# the pool outlives reruns, so connections (and their statement caches) are opened once
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    pool = queue.LifoQueue(maxsize=POOL_SIZE)
+    for _ in range(POOL_SIZE):
+        pool.put(open_conn())
+    return pool
+
+@contextmanager
+def pooled_conn():
+    # blocks while all POOL_SIZE connections are checked out; never hold one across another checkout
+    pool = get_pool()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        pool.put(conn)
 
 # ------------------------ SIMPLE LOGIN ------------------------
 def login():
@@ -59,95 +167,295 @@ def ensure_session_state():
         st.session_state.username = ""
 
 # ------------------------ DATA ACCESS ------------------------
-def fetch_parts(conn, search=""):
-    q = """
+# Statement text lives at module level so every call hands sqlite3 the identical
+# string and hits the connection's prepared-statement cache instead of re-preparing.
+# Unfiltered listings walk the part_number UNIQUE autoindex in order, so ORDER BY costs no sort.
+SQL_FETCH_PARTS = """
     SELECT id, part_number, description, machine_type, supplier, min_qty, current_qty, location
     FROM SpareParts
-    WHERE part_number LIKE ? OR description LIKE ? OR COALESCE(machine_type,'') LIKE ? OR COALESCE(supplier,'') LIKE ?
     ORDER BY part_number;
-    """
-    like = f"%{search}%"
-    return pd.read_sql_query(q, conn, params=(like, like, like, like))
-
-def fetch_transactions(conn, limit=200):
-    q = """
-    SELECT t.id, s.part_number, t.ts, t.user, t.action, t.quantity, t.remarks
-    FROM Transactions t
-    JOIN SpareParts s ON s.id = t.part_id
-    ORDER BY datetime(t.ts) DESC
+"""
+SQL_PICKER_PARTS = """
+    SELECT id, part_number, description
+    FROM SpareParts
+    ORDER BY part_number;
+"""
+SQL_PART_STOCK = "SELECT current_qty, min_qty, location FROM SpareParts WHERE id=?;"
+# Searches sort only the FTS match set; walking the part_number index instead would visit every row.
+SQL_SEARCH_PARTS = """
+    SELECT s.id, s.part_number, s.description, s.machine_type, s.supplier, s.min_qty, s.current_qty, s.location
+    FROM SparePartsFTS f
+    JOIN SpareParts s ON s.id = f.rowid
+    WHERE SparePartsFTS MATCH ?
+    ORDER BY s.part_number;
+"""
+# FTS only matches word prefixes, so "6204" misses "BRG6204"; when FTS finds nothing the
+# search falls back to a substring match on part_number alone
+SQL_FTS_ANY = "SELECT 1 FROM SparePartsFTS WHERE SparePartsFTS MATCH ? LIMIT 1;"
+SQL_LIKE_PARTS = """
+    SELECT id, part_number, description, machine_type, supplier, min_qty, current_qty, location
+    FROM SpareParts
+    WHERE part_number LIKE ? ESCAPE '\\'
+    ORDER BY part_number;
+"""
+SQL_PART_TOTALS = """
+    SELECT COUNT(*), COALESCE(SUM(current_qty), 0),
+           COALESCE(SUM(low_stock), 0)
+    FROM SpareParts;
+"""
+SQL_SEARCH_PART_TOTALS = """
+    SELECT COUNT(*), COALESCE(SUM(s.current_qty), 0),
+           COALESCE(SUM(s.low_stock), 0)
+    FROM SparePartsFTS f
+    JOIN SpareParts s ON s.id = f.rowid
+    WHERE SparePartsFTS MATCH ?;
+"""
+SQL_LIKE_PART_TOTALS = """
+    SELECT COUNT(*), COALESCE(SUM(current_qty), 0),
+           COALESCE(SUM(low_stock), 0)
+    FROM SpareParts
+    WHERE part_number LIKE ? ESCAPE '\\';
+"""
+SQL_FETCH_TRANSACTIONS = """
+    SELECT id, part_number, ts, user, action, quantity, remarks
+    FROM Transactions
+    ORDER BY ts DESC
     LIMIT ?;
-    """
-    return pd.read_sql_query(q, conn, params=(limit,))
+"""
+# the WHERE clause must match idx_parts_lowbool exactly for the partial index to be used
+SQL_FETCH_LOW_STOCK = """
+    SELECT part_number, description, machine_type, current_qty, min_qty, location
+    FROM SpareParts
+    WHERE low_stock = 1
+    ORDER BY part_number;
+"""
+SQL_SEARCH_LOW_STOCK = """
+    SELECT s.part_number, s.description, s.machine_type, s.current_qty, s.min_qty, s.location
+    FROM SparePartsFTS f
+    JOIN SpareParts s ON s.id = f.rowid
+    WHERE SparePartsFTS MATCH ? AND s.low_stock = 1
+    ORDER BY s.part_number;
+"""
+SQL_LIKE_LOW_STOCK = """
+    SELECT part_number, description, machine_type, current_qty, min_qty, location
+    FROM SpareParts
+    WHERE part_number LIKE ? ESCAPE '\\' AND low_stock = 1
+    ORDER BY part_number;
+"""
+SQL_INSERT_PART = """
+    INSERT INTO SpareParts (part_number, description, machine_type, supplier, min_qty, current_qty, location)
+    VALUES (?, ?, ?, ?, ?, ?, ?);
+"""
+# current_qty is never overwritten by an upsert: stock on an existing part only moves through
+# adjust_stock, so every change shows up in Transactions
+UPSERT_COLUMNS = ("description", "machine_type", "supplier", "min_qty", "location")
+SQL_UPDATE_PART = """
+    UPDATE SpareParts SET
+        part_number=?, description=?, machine_type=?, supplier=?, min_qty=?, current_qty=?, location=?
+    WHERE id=?;
+"""
+SQL_DELETE_PART = "DELETE FROM SpareParts WHERE id=?;"
+SQL_PART_EXISTS = "SELECT 1 FROM SpareParts WHERE id=?;"
+# the stock check and the update are one atomic statement (needs SQLite >= 3.35)
+SQL_ADJUST_UPDATE = """
+    UPDATE SpareParts SET current_qty = COALESCE(current_qty, 0) + ?
+    WHERE id=? AND COALESCE(current_qty, 0) + ? >= 0
+    RETURNING current_qty, part_number;
+"""
+SQL_ADJUST_INSERT_TX = """
+    INSERT INTO Transactions (part_id, part_number, ts, user, action, quantity, remarks)
+    VALUES (?, ?, ?, ?, ?, ?, ?);
+"""
+
+def query_df(q, params=()):
+    # build the frame straight from the cursor rows; cheaper than pd.read_sql_query
+    with pooled_conn() as conn:
+        cur = conn.execute(q, params)
+        return pd.DataFrame.from_records(cur.fetchall(), columns=[c[0] for c in cur.description])
+
+def downcast_qty(df):
+    # quantities fit comfortably in int32, which halves their footprint versus pandas' default int64
+    cols = ["min_qty", "current_qty"]
+    df[cols] = df[cols].fillna(0).astype("int32")
+    return df
+
+def fts_query(search):
+    # every word becomes a quoted prefix term, so user input can't inject FTS5 syntax
+    terms = ['"' + term.replace('"', '""') + '"*' for term in search.split()]
+    return " ".join(terms)
+
+def like_pattern(search):
+    escaped = search.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def search_query(search, all_sql, fts_sql, like_sql):
+    # pick (sql, params) for a search: everything, FTS word-prefix match, or part_number substring
+    match = fts_query(search)
+    if not match:
+        return all_sql, ()
+    with pooled_conn() as conn:
+        fts_hit = conn.execute(SQL_FTS_ANY, (match,)).fetchone()
+    if fts_hit:
+        return fts_sql, (match,)
+    return like_sql, (like_pattern(search),)
+
+# results are cached per argument and cleared by invalidate_caches() after every write
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_parts(search=""):
+    return downcast_qty(query_df(*search_query(search, SQL_FETCH_PARTS, SQL_SEARCH_PARTS, SQL_LIKE_PARTS)))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_part_totals(search=""):
+    # (part count, total qty, low-stock count) in one round-trip; no rows cross into pandas
+    q, params = search_query(search, SQL_PART_TOTALS, SQL_SEARCH_PART_TOTALS, SQL_LIKE_PART_TOTALS)
+    with pooled_conn() as conn:
+        return conn.execute(q, params).fetchone()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_transactions(limit=200):
+    df = query_df(SQL_FETCH_TRANSACTIONS, (limit,))
+    df["ts"] = pd.to_datetime(df["ts"], format="ISO8601")
+    return df
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_low_stock(search=""):
+    return downcast_qty(query_df(*search_query(search, SQL_FETCH_LOW_STOCK, SQL_SEARCH_LOW_STOCK, SQL_LIKE_LOW_STOCK)))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def parts_for_picker():
+    # (id, part_number, description) tuples for the Issue/Receive dropdown; no DataFrame needed
+    with pooled_conn() as conn:
+        return conn.execute(SQL_PICKER_PARTS).fetchall()
+
+def invalidate_caches():
+    parts_for_picker.clear()
+    fetch_parts.clear()
+    fetch_part_totals.clear()
+    fetch_transactions.clear()
+    fetch_low_stock.clear()
+
+def part_values(row):
+    return (row["part_number"], row.get("description",""), row.get("machine_type",""), row.get("supplier",""),
+            int(row.get("min_qty") or 0), int(row.get("current_qty") or 0), row.get("location",""))
 
 def insert_part(conn, row):
     with conn:
-        conn.execute("""
-            INSERT INTO SpareParts (part_number, description, machine_type, supplier, min_qty, current_qty, location)
-            VALUES (?, ?, ?, ?, ?, ?, ?);
-        """, (row["part_number"], row.get("description",""), row.get("machine_type",""), row.get("supplier",""),
-              int(row.get("min_qty",0)), int(row.get("current_qty",0)), row.get("location","")))
+        conn.execute(SQL_INSERT_PART, part_values(row))
+    invalidate_caches()
+
+def upsert_sql(columns):
+    # only the columns the caller actually supplied are copied onto an existing part
+    updates = [f"{col}=excluded.{col}" for col in UPSERT_COLUMNS if col in columns]
+    action = "DO UPDATE SET " + ", ".join(updates) if updates else "DO NOTHING"
+    return SQL_INSERT_PART.rstrip().rstrip(";") + f"\n    ON CONFLICT(part_number) {action};"
+
+def upsert_part(conn, row):
+    # insert, or update the existing part with the same part_number, in one statement
+    with conn:
+        conn.execute(upsert_sql(row.keys()), part_values(row))
+    invalidate_caches()
+
+def upsert_parts_bulk(conn, rows):
+    # one transaction for the whole batch, so the import costs a single commit
+    if not rows:
+        return
+    columns = set.intersection(*(set(row) for row in rows))
+    with conn:
+        conn.executemany(upsert_sql(columns), [part_values(row) for row in rows])
+    invalidate_caches()
 
 def update_part(conn, pid, row):
     with conn:
-        conn.execute("""
-            UPDATE SpareParts SET
-                part_number=?, description=?, machine_type=?, supplier=?, min_qty=?, current_qty=?, location=?
-            WHERE id=?;
-        """, (row["part_number"], row.get("description",""), row.get("machine_type",""), row.get("supplier",""),
-              int(row.get("min_qty",0)), int(row.get("current_qty",0)), row.get("location",""), pid))
+        conn.execute(SQL_UPDATE_PART, part_values(row) + (pid,))
+    invalidate_caches()
 
 def delete_part(conn, pid):
     with conn:
-        conn.execute("DELETE FROM SpareParts WHERE id=?;", (pid,))
+        conn.execute(SQL_DELETE_PART, (pid,))
+    invalidate_caches()
 
-def adjust_stock(conn, part_id, qty, action, user, remarks=""):
+def adjust_stock(conn, part_id, qty, action, user, remarks="", ts=None):
+    # callers recording several movements together can pass one shared ts
+    ts = ts or datetime.now().isoformat(timespec="seconds")
     qty = int(qty)
     if action not in ("IN", "OUT"):
         raise ValueError("Action must be IN or OUT")
+    delta = qty if action == "IN" else -qty
     with conn:
-        cur = conn.execute("SELECT current_qty FROM SpareParts WHERE id=?", (part_id,)).fetchone()
-        if not cur:
-            raise ValueError("Part not found")
-        current = cur[0] or 0
-        new_qty = current + qty if action == "IN" else current - qty
-        if new_qty < 0:
+        updated = conn.execute(SQL_ADJUST_UPDATE, (delta, part_id, delta)).fetchone()
+        if not updated:
+            if not conn.execute(SQL_PART_EXISTS, (part_id,)).fetchone():
+                raise ValueError("Part not found")
             raise ValueError("Cannot go below zero stock")
-        conn.execute("UPDATE SpareParts SET current_qty=? WHERE id=?", (new_qty, part_id))
-        conn.execute("""
-            INSERT INTO Transactions (part_id, ts, user, action, quantity, remarks)
-            VALUES (?, ?, ?, ?, ?, ?);
-        """, (part_id, datetime.now().isoformat(timespec="seconds"), user, action, qty, remarks))
+        conn.execute(SQL_ADJUST_INSERT_TX,
+                     (part_id, updated[1], ts, user, action, qty, remarks))
+    invalidate_caches()
+
+def adjust_stock_bulk(conn, ops, user):
+    # ops: iterable of (part_id, qty, action, remarks); all-or-nothing in one transaction
+    ops = [(int(part_id), int(qty), action, remarks) for part_id, qty, action, remarks in ops]
+    if not ops:
+        return
+    if any(action not in ("IN", "OUT") for _, _, action, _ in ops):
+        raise ValueError("Action must be IN or OUT")
+    ts = datetime.now().isoformat(timespec="seconds")
+    tx_rows = []
+    with conn:
+        # each op is applied as a guarded delta, so concurrent writers can't be overwritten
+        # and any op that would go negative rolls back the whole batch
+        for part_id, qty, action, remarks in ops:
+            delta = qty if action == "IN" else -qty
+            updated = conn.execute(SQL_ADJUST_UPDATE, (delta, part_id, delta)).fetchone()
+            if not updated:
+                if not conn.execute(SQL_PART_EXISTS, (part_id,)).fetchone():
+                    raise ValueError("Part not found")
+                raise ValueError("Cannot go below zero stock")
+            tx_rows.append((part_id, updated[1], ts, user, action, qty, remarks))
+        conn.executemany(SQL_ADJUST_INSERT_TX, tx_rows)
+    invalidate_caches()
 
 # ------------------------ UI PAGES ------------------------
-def dashboard(conn):
+def search_box(key, label):
+    # inside a form the value only changes on submit, so typing doesn't rerun the query
+    with st.form(key):
+        search = st.text_input(label, help="Matches words starting with the text in part number, description, "
+                                           "machine type or supplier. If nothing matches, part numbers "
+                                           "containing the text anywhere are shown.")
+        st.form_submit_button("Search")
+    return search
+
+def dashboard():
     st.subheader("📊 Dashboard")
-    df = fetch_parts(conn, search=st.text_input("Search parts"))
+    search = search_box("dashboard_search", "Search parts")
+    total_parts, total_qty, low_count = fetch_part_totals(search=search)
     c1, c2, c3 = st.columns(3)
     with c1:
-        st.metric("Total Parts", len(df))
+        st.metric("Total Parts", total_parts)
     with c2:
-        st.metric("Total Qty", int(df["current_qty"].sum()))
+        st.metric("Total Qty", int(total_qty))
     with c3:
-        st.metric("Low Stock Items", int((df["current_qty"] < df["min_qty"]).sum()))
+        st.metric("Low Stock Items", int(low_count))
 
     st.write("### Low Stock Alerts")
-    low_df = df[df["current_qty"] < df["min_qty"]]
+    low_df = fetch_low_stock(search=search)
     if low_df.empty:
         st.success("All good. No items below minimum quantity.")
     else:
         st.warning(f"{len(low_df)} items below minimum:")
-        st.dataframe(low_df[["part_number","description","machine_type","current_qty","min_qty","location"]])
+        st.dataframe(low_df)
 
     st.write("### Recent Transactions")
-    tx = fetch_transactions(conn, limit=100)
+    tx = fetch_transactions(limit=100)
     st.dataframe(tx)
 
-def parts_page(conn):
+def parts_page():
     st.subheader("📦 Spare Parts")
-    tab1, tab2 = st.tabs(["List & Edit", "Add New"])
+    if st.session_state.pop("last_action", None) == "delete":
+        st.success("Deleted.")
+    tab1, tab2, tab3 = st.tabs(["List & Edit", "Add New", "Bulk Import"])
     with tab1:
-        search = st.text_input("Search")
-        df = fetch_parts(conn, search=search)
+        search = search_box("parts_search", "Search")
+        df = fetch_parts(search=search)
         st.dataframe(df)
         if not df.empty:
             st.markdown("#### Edit / Delete")
@@ -163,21 +471,23 @@ def parts_page(conn):
                 location = st.text_input("Location", value=row.location or "")
                 submitted = st.form_submit_button("Save Changes")
                 if submitted:
-                    update_part(conn, int(row.id), {
-                        "part_number": part_number.strip(),
-                        "description": description.strip(),
-                        "machine_type": machine_type.strip(),
-                        "supplier": supplier.strip(),
-                        "min_qty": int(min_qty),
-                        "current_qty": int(current_qty),
-                        "location": location.strip(),
-                    })
+                    with pooled_conn() as conn:
+                        update_part(conn, int(row.id), {
+                            "part_number": part_number.strip(),
+                            "description": description.strip(),
+                            "machine_type": machine_type.strip(),
+                            "supplier": supplier.strip(),
+                            "min_qty": int(min_qty),
+                            "current_qty": int(current_qty),
+                            "location": location.strip(),
+                        })
                     st.success("Saved.")
-                    st.experimental_rerun()
             if st.button("Delete Selected Part"):
-                delete_part(conn, int(row.id))
-                st.success("Deleted.")
-                st.experimental_rerun()
+                with pooled_conn() as conn:
+                    delete_part(conn, int(row.id))
+                # the deleted row is still on screen and selected, so this one needs a fresh run
+                st.session_state["last_action"] = "delete"
+                st.rerun()
 
     with tab2:
         st.markdown("#### Add New Part")
@@ -191,47 +501,77 @@ def parts_page(conn):
             location = st.text_input("Location (Rack/Shelf/Box)")
             submitted = st.form_submit_button("Add Part")
             if submitted and part_number.strip():
-                insert_part(conn, {
-                    "part_number": part_number.strip(),
-                    "description": description.strip(),
-                    "machine_type": machine_type.strip(),
-                    "supplier": supplier.strip(),
-                    "min_qty": int(min_qty),
-                    "current_qty": int(current_qty),
-                    "location": location.strip(),
-                })
+                with pooled_conn() as conn:
+                    insert_part(conn, {
+                        "part_number": part_number.strip(),
+                        "description": description.strip(),
+                        "machine_type": machine_type.strip(),
+                        "supplier": supplier.strip(),
+                        "min_qty": int(min_qty),
+                        "current_qty": int(current_qty),
+                        "location": location.strip(),
+                    })
                 st.success("Part added.")
-                st.experimental_rerun()
 
-def io_page(conn):
+    with tab3:
+        st.markdown("#### Bulk Import")
+        st.caption("CSV columns: part_number, description, machine_type, supplier, min_qty, current_qty, location. "
+                   "Rows whose part_number already exists update only the columns present in the CSV; "
+                   "current_qty is used for new parts only (use Issue/Receive to change stock).")
+        uploaded = st.file_uploader("Parts CSV", type="csv")
+        if uploaded is not None:
+            upload_df = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+            if "part_number" not in upload_df.columns:
+                st.error("CSV must have a part_number column.")
+                return
+            rows = [{k: str(v).strip() for k, v in r.items()} for r in upload_df.to_dict("records")]
+            rows = [r for r in rows if r["part_number"]]
+            st.dataframe(upload_df)
+            if st.button(f"Import {len(rows)} Parts"):
+                try:
+                    with pooled_conn() as conn:
+                        upsert_parts_bulk(conn, rows)
+                except (sqlite3.IntegrityError, ValueError) as e:
+                    st.error(f"Import failed, nothing was saved: {e}")
+                else:
+                    st.success(f"Imported {len(rows)} parts.")
+
+def io_page():
     st.subheader("🔁 Issue / Receive")
-    df = fetch_parts(conn)
-    if df.empty:
+    parts = parts_for_picker()
+    if not parts:
         st.info("No parts yet. Add some parts first.")
         return
-    part = st.selectbox("Select Part", df.apply(lambda r: f"{r.part_number} — {r.description}", axis=1))
-    selected_row = df[df.apply(lambda r: f"{r.part_number} — {r.description}", axis=1) == part].iloc[0]
-    st.caption(f"Current Qty: {selected_row.current_qty} | Min Qty: {selected_row.min_qty} | Location: {selected_row.location}")
+    id_by_label = {f"{part_number} — {description or ''}": pid for pid, part_number, description in parts}
+    selected_id = id_by_label[st.selectbox("Select Part", list(id_by_label))]
+    with pooled_conn() as conn:
+        current_qty, min_qty, location = conn.execute(SQL_PART_STOCK, (selected_id,)).fetchone()
+    st.caption(f"Current Qty: {current_qty} | Min Qty: {min_qty} | Location: {location}")
     action = st.radio("Action", ["OUT","IN"], horizontal=True, index=0)
     qty = st.number_input("Quantity", min_value=1, step=1, value=1)
     remarks = st.text_input("Remarks", placeholder="WO#123, Line 3, etc.")
     if st.button("Submit"):
-        adjust_stock(conn, int(selected_row.id), int(qty), action, st.session_state.username, remarks)
+        with pooled_conn() as conn:
+            adjust_stock(conn, selected_id, int(qty), action, st.session_state.username, remarks)
         st.success(f"Recorded {action} x{qty}.")
-        st.experimental_rerun()
 
-def reports_page(conn):
+def csv_bytes(df):
+    # encode straight into a byte buffer instead of building the whole CSV as a str first
+    buf = BytesIO()
+    df.to_csv(buf, index=False, encoding="utf-8")
+    return buf.getvalue()
+
+def reports_page():
     st.subheader("🧾 Reports")
-    df = fetch_parts(conn)
+    df = fetch_parts()
     st.write("### Low Stock")
-    low_df = df[df["current_qty"] < df["min_qty"]]
-    st.dataframe(low_df[["part_number","description","machine_type","current_qty","min_qty","location"]])
+    st.dataframe(fetch_low_stock())
     st.write("### Transactions")
-    tx = fetch_transactions(conn, limit=200)
+    tx = fetch_transactions(limit=200)
     st.dataframe(tx)
 
-    st.download_button("Export Parts CSV", df.to_csv(index=False).encode("utf-8"), file_name="spare_parts.csv")
-    st.download_button("Export Transactions CSV", tx.to_csv(index=False).encode("utf-8"), file_name="transactions.csv")
+    st.download_button("Export Parts CSV", csv_bytes(df), file_name="spare_parts.csv")
+    st.download_button("Export Transactions CSV", csv_bytes(tx), file_name="transactions.csv")
 
 # ------------------------ MAIN ------------------------
 def main():
@@ -244,16 +584,15 @@ def main():
         st.stop()
 
     st.title("🔧 Spare Inventory Manager")
-    conn = get_conn()
     page = st.sidebar.radio("Navigate", ["Dashboard", "Spare Parts", "Issue/Receive", "Reports"], index=0)
     if page == "Dashboard":
-        dashboard(conn)
+        dashboard()
     elif page == "Spare Parts":
-        parts_page(conn)
+        parts_page()
     elif page == "Issue/Receive":
-        io_page(conn)
+        io_page()
     elif page == "Reports":
-        reports_page(conn)
+        reports_page()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file